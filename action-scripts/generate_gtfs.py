@@ -1,8 +1,20 @@
 import os
 import json
 import csv
-import math
-from collections import defaultdict
+import itertools
+import mmap
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from operator import itemgetter
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional: without it JSON files are parsed with the json module
+    orjson = None
 
 # Get the absolute path to the repository root
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,35 +24,76 @@ ROUTES_JSON = os.path.join(REPO_ROOT, 'routes.json')
 ROUTE_DATA_DIR = os.path.join(REPO_ROOT, 'route-data', 'geojson')
 SCHEDULE_DIR = os.path.join(REPO_ROOT, 'route-data', 'schedule')  # Directory for schedule CSVs
 GTFS_DIR = os.path.join(REPO_ROOT, 'gtfs')
+GTFS_ZIP = os.path.join(REPO_ROOT, 'otp-deploy', 'gtfs.zip')  # Packaged feed for OTP
 TIMEZONE = 'Asia/Jakarta'
 
+# Row types for the generated GTFS tables; field names are the CSV columns
+Stop = namedtuple('Stop', 'stop_id stop_name stop_lat stop_lon location_type wheelchair_boarding')
+Trip = namedtuple('Trip', 'route_id trip_id service_id trip_headsign direction_id shape_id block_id')
+StopTime = namedtuple('StopTime', 'trip_id stop_id stop_sequence arrival_time departure_time pickup_type drop_off_type')
+
 # Helper functions for distance and time calculations
-def haversine(lon1, lat1, lon2, lat2):
-    """Calculate distance between two geo-coordinates (in km)"""
-    lon1, lat1, lon2, lat2 = map(math.radians, [lon1, lat1, lon2, lat2])
+def haversine_rad_np(lon1, lat1, lon2, lat2):
+    """Vectorized haversine over coordinate arrays given in radians (in km)"""
     dlon = lon2 - lon1
     dlat = lat2 - lat1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    return 6371 * 2 * math.asin(math.sqrt(a))  # Earth radius=6371km
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
+
+def path_segment_lengths(lons_r, lats_r):
+    """Haversine length (in km) of each leg of a path given in radians"""
+    cos_lat = np.cos(lats_r)
+    dlon = lons_r[1:] - lons_r[:-1]
+    dlat = lats_r[1:] - lats_r[:-1]
+    a = np.sin(dlat/2)**2 + cos_lat[:-1] * cos_lat[1:] * np.sin(dlon/2)**2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
 
 def time_str_to_seconds(time_str):
     """Convert HH:MM string to seconds since midnight"""
-    h, m = map(int, time_str.split(':'))
-    return h * 3600 + m * 60
+    h, _, m = time_str.partition(':')
+    return int(h) * 3600 + int(m) * 60
+
+# HH:MM:SS strings for every second up to 48:00:00; anything beyond is formatted on demand
+_MM_SS = [f"{m:02d}:{s:02d}" for m in range(60) for s in range(60)]
+_TIME_STRS = [hh + mm_ss for hh in [f"{h:02d}:" for h in range(48)] for mm_ss in _MM_SS]
 
 def seconds_to_time_str(total_seconds):
     """Convert seconds to HH:MM:SS format"""
     # Round to nearest second before conversion
     total_seconds = round(total_seconds)
+    if 0 <= total_seconds < len(_TIME_STRS):
+        return _TIME_STRS[total_seconds]
     h = total_seconds // 3600
     m = (total_seconds % 3600) // 60
     s = total_seconds % 60
     return f"{int(h):02d}:{int(m):02d}:{int(s):02d}"
 
+def _gen_stop_times(trip_starts, lons_r, lats_r, dwell_seconds):
+    """Arrival/departure seconds for every (trip, stop) pair of a route"""
+    # Segment times between consecutive stops, at least 10 meters apart
+    dists = np.maximum(path_segment_lengths(lons_r, lats_r), 0.01)
+    speeds = np.where(dists <= 5, 30.0, 55.0)
+    # Cumulative travel times, starting with 0 for the first stop
+    cumulative_travel = np.zeros(lons_r.shape[0])
+    cumulative_travel[1:] = np.cumsum(dists / speeds * 3600)
+    
+    dwell = np.arange(cumulative_travel.shape[0]) * dwell_seconds
+    arrivals = (trip_starts.reshape(-1, 1) + cumulative_travel.reshape(1, -1)
+                + dwell.reshape(1, -1))
+    departures = arrivals + dwell_seconds
+    return np.rint(arrivals).astype(np.int64), np.rint(departures).astype(np.int64)
+
+def seconds_to_time_strs(seconds):
+    """Convert an array of seconds to a flat list of HH:MM:SS strings"""
+    # Round to nearest second before conversion
+    total_seconds = np.rint(seconds).astype(np.int64).ravel()
+    if total_seconds.size and (total_seconds.min() < 0 or total_seconds.max() >= len(_TIME_STRS)):
+        return [seconds_to_time_str(t) for t in total_seconds.tolist()]
+    return list(map(_TIME_STRS.__getitem__, total_seconds.tolist()))
+
 def process_routes():
     """Process routes.json and return enhanced route data"""
-    with open(ROUTES_JSON) as f:
-        data = json.load(f)
+    data = read_json_file(ROUTES_JSON)
     
     agencies = []
     route_groups = []
@@ -83,369 +136,397 @@ def process_routes():
     
     return agencies, route_groups, all_routes
 
-def process_stops(routes):
-    """Collect all stops from all routes with deduplication"""
-    all_stops = {}
-    stop_counter = 1
-    
-    for route in routes:
-        route_id = route['relationId']
-        stop_file = os.path.join(ROUTE_DATA_DIR, str(route_id), 'stops.geojson')
-        
-        if not os.path.exists(stop_file):
-            print(f"Stop file not found for route {route_id}: {stop_file}")
-            # Print parent directory contents for debugging
-            parent_dir = os.path.dirname(stop_file)
-            if os.path.exists(parent_dir):
-                print(f"Directory contents: {os.listdir(parent_dir)}")
-            continue
-            
-        with open(stop_file) as f:
-            data = json.load(f)
+def read_json_file(path):
+    """Parse a JSON file directly from a read-only memory map of it"""
+    with open(path, 'rb') as f:
+        if orjson is None:
+            return json.load(f)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # orjson reads the mapped pages without an intermediate bytes copy
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
+def _line_lonlat(line):
+    """Convert a GeoJSON line's positions to an (N, 2) lon/lat array"""
+    if not line:
+        return np.empty((0, 2), dtype=np.float64)
+    try:
+        coords = np.asarray(line, dtype=np.float64)
+    except ValueError:
+        # Positions of mixed dimension (some with altitude)
+        coords = np.array([position[:2] for position in line], dtype=np.float64)
+    # Positions may carry an altitude after lon/lat, which is dropped
+    return coords.reshape(len(line), -1)[:, :2]
+
+def extract_way_coords(features):
+    """Flatten LineString/MultiLineString features into an (N, 2) lon/lat array"""
+    # Convert each line to its own array while preserving feature order
+    line_arrays = []
+    for feature in features:
+        geom = feature['geometry']
+        geom_type = geom['type']
         
-        for feature in data['features']:
-            props = feature['properties']
-            geom = feature['geometry']
-            coords = geom['coordinates']
-            
-            # Create unique stop ID using OSM ID or generate new
-            stop_id = props.get('id', f"stop_{stop_counter}")
-            stop_counter += 1
-            
-            if stop_id not in all_stops:
-                all_stops[stop_id] = {
-                    'stop_id': stop_id,
-                    'stop_name': props.get('name', f"Stop {stop_id}"),
-                    'stop_lat': coords[1],
-                    'stop_lon': coords[0],
-                    'location_type': 0,
-                    'wheelchair_boarding': 1 if props.get('wheelchair') == 'yes' else 0
-                }
-    
-    return all_stops
-
-def process_shapes(routes):
-    """Process route geometries into GTFS shapes with correct sequencing"""
-    shapes = []
+        if geom_type == 'LineString':
+            # Preserve original coordinate order
+            line_arrays.append(_line_lonlat(geom['coordinates']))
+        elif geom_type == 'MultiLineString':
+            # Preserve order of linestrings and their coordinates
+            for line in geom['coordinates']:
+                line_arrays.append(_line_lonlat(line))
     
+    if not line_arrays:
+        return np.empty((0, 2), dtype=np.float64)
+    # Join the lines in a single copy while maintaining sequence
+    return np.concatenate(line_arrays)
+
+def extract_stop_records(features):
+    """Reduce Point features to (id, lon, lat, is_real, properties) tuples"""
+    stops = []
+    for feature in features:
+        props = feature['properties']
+        coords = feature['geometry']['coordinates']
+        stops.append((props.get('id'), coords[0], coords[1], props.get('isReal', False), props))
+    return stops
+
+def discover_route_files():
+    """Map each route directory name to the paths of its GeoJSON files"""
+    route_files = {}
+    with os.scandir(ROUTE_DATA_DIR) as route_dirs:
+        for route_dir in route_dirs:
+            if not route_dir.is_dir():
+                continue
+            with os.scandir(route_dir.path) as entries:
+                paths = {entry.name: entry.path for entry in entries}
+            route_files[route_dir.name] = {
+                'stops': paths.get('stops.geojson'),
+                'ways': paths.get('ways.geojson')
+            }
+    return route_files
+
+def attach_route_paths(routes):
+    """Store each route's GeoJSON paths on the route"""
+    route_files = discover_route_files()
     for route in routes:
-        route_id = route['relationId']
-        ways_file = os.path.join(ROUTE_DATA_DIR, str(route_id), 'ways.geojson')
-        
-        if not os.path.exists(ways_file):
-            print(f"Ways file not found for route {route_id}: {ways_file}")
-            continue
-            
-        with open(ways_file) as f:
-            data = json.load(f)
-        
-        # Extract coordinates while preserving feature order
-        all_coords = []
-        for feature in data['features']:
-            geom = feature['geometry']
-            geom_type = geom['type']
-            
-            if geom_type == 'LineString':
-                # Preserve original coordinate order
-                all_coords.append(geom['coordinates'])
-            elif geom_type == 'MultiLineString':
-                # Preserve order of linestrings and their coordinates
-                for line in geom['coordinates']:
-                    all_coords.append(line)
-        
-        # Flatten while maintaining sequence
-        coords = []
-        for feature_coords in all_coords:
-            coords.extend(feature_coords)
+        route['geojson_paths'] = route_files.get(str(route['relationId']))
+
+def load_route_data(route):
+    """Load a route's stop records and ways coordinates"""
+    route_id = route['relationId']
+    paths = route['geojson_paths']
+    if paths is None:
+        print(f"Route data directory not found for route {route_id}")
+        return None, None
+    
+    route_stops, ways_coords = None, None
+    
+    if paths['stops']:
+        route_stops = extract_stop_records(read_json_file(paths['stops'])['features'])
+    else:
+        print(f"Stop file not found for route {route_id}")
+    
+    if paths['ways']:
+        ways_coords = extract_way_coords(read_json_file(paths['ways'])['features'])
+    else:
+        print(f"Ways file not found for route {route_id}")
+    
+    return route_stops, ways_coords
+
+def build_shape(shape_id, coords):
+    """Turn a route's (N, 2) coordinate array into a columnar GTFS shape"""
+    # Compute every segment of the route in one vectorized pass
+    lons, lats = coords[:, 0], coords[:, 1]
+    lons_r, lats_r = np.deg2rad(lons), np.deg2rad(lats)
+    segment_dists = path_segment_lengths(lons_r, lats_r)
+    # Slice so an empty shape gets no distances rather than a lone 0.0
+    cumulative_dists = np.concatenate(([0.0], np.cumsum(segment_dists)))[:len(lons)]
+    dists = np.array([round(dist, 6) for dist in cumulative_dists.tolist()], dtype=np.float64)
+    
+    return shape_id, lons, lats, dists
+
+def build_stop_sequence(route_stops, shape):
+    """Order a bus route's stops along its shape"""
+    stop_order = list(range(len(route_stops)))
+    stop_lonlat_rad = np.deg2rad(np.array([(stop[1], stop[2]) for stop in route_stops],
+                                          dtype=np.float64).reshape(-1, 2))
+    
+    # NEW: Prioritize real stops when projecting to shape
+    if shape is not None and len(shape[1]):
+        # Sort the shape's points by distance (should be sequential but ensure)
+        _, shape_lons, shape_lats, shape_dists = shape
+        order = np.argsort(shape_dists, kind='stable')
+        shape_lons_r = np.deg2rad(shape_lons[order])
+        shape_lats_r = np.deg2rad(shape_lats[order])
+        shape_dists = shape_dists[order]
         
-        # Create shape records with cumulative distance
-        shape_id = f"shape_{route_id}"
-        cumulative_dist = 0.0
-        prev_lon, prev_lat = None, None
+        # Project every stop onto its closest shape point at once, with
+        # one row of distances per stop and one column per shape point
+        dists_to_shape = haversine_rad_np(stop_lonlat_rad[:, 0, None], stop_lonlat_rad[:, 1, None],
+                                          shape_lons_r[None, :], shape_lats_r[None, :])
+        stop_shape_dists = shape_dists[np.argmin(dists_to_shape, axis=1)]
         
-        for seq, coord in enumerate(coords):
-            lon, lat = coord[0], coord[1]
-            
-            if prev_lon is not None:
-                segment_dist = haversine(prev_lon, prev_lat, lon, lat)
-                cumulative_dist += segment_dist
-            
-            shapes.append({
-                'shape_id': shape_id,
-                'shape_pt_lon': lon,
-                'shape_pt_lat': lat,
-                'shape_pt_sequence': seq + 1,
-                'shape_dist_traveled': round(cumulative_dist, 6)
-            })
-            
-            prev_lon, prev_lat = lon, lat
-        
-        # Store shape ID for trip assignment
-        route['shape_id'] = shape_id
+        # Sort stops primarily by shape distance, secondarily by real status
+        # (real stops come first at the same position)
+        virtual_rank = [0 if stop[3] else 1 for stop in route_stops]
+        shape_order = np.lexsort((virtual_rank, stop_shape_dists))
+        stop_order = shape_order.tolist()
+        stop_lonlat_rad = stop_lonlat_rad[shape_order]
     
-    return shapes
+    return stop_order, stop_lonlat_rad
 
-def generate_trips(routes, shapes):
-    """Generate trips and stop times with block_id support"""
-    trips = []
-    stop_times = []
-    
-    # Precompute shape dictionary for quick lookup
-    shapes_dict = {}
-    for shape in shapes:
-        shape_id = shape['shape_id']
-        if shape_id not in shapes_dict:
-            shapes_dict[shape_id] = []
-        shapes_dict[shape_id].append({
-            'lon': shape['shape_pt_lon'],
-            'lat': shape['shape_pt_lat'],
-            'dist': shape['shape_dist_traveled']
-        })
+def _process_one_route(route):
+    """Load and process a single route; runs in a worker process"""
+    route_id = route['relationId']
+    route_stops, ways_coords = load_route_data(route)
+    result = {'stops': route_stops, 'shape': None, 'stop_sequence': None}
     
-    # Sort each shape's points by distance (should be sequential but ensure)
-    for shape_id in shapes_dict:
-        shapes_dict[shape_id].sort(key=lambda pt: pt['dist'])
+    if ways_coords is not None:
+        result['shape'] = build_shape(f"shape_{route_id}", ways_coords)
     
-    # Track trip counts per direction per group (for bus only)
-    group_direction_counts = defaultdict(lambda: defaultdict(int))
+    # Train stop times come from schedule CSVs; only buses need a stop sequence
+    if route.get('mode') != 'train' and route_stops is not None:
+        result['stop_sequence'] = build_stop_sequence(route_stops, result['shape'])
     
-    for route in routes:
-        route_id = route['relationId']
-        agency_id = route['agency_id']
-        group_id = route['group_id']
-        direction = route['directionId']
+    return result
+
+def process_route_data(routes):
+    """Process every route in parallel, returning results in route order"""
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return list(executor.map(_process_one_route, routes, chunksize=4))
+
+def load_schedule(agency_id, direction):
+    """Read a schedule CSV, bucketing its trip rows by route ID"""
+    # Build CSV path: route-data/schedule/{agencyId}_{direction}.csv
+    csv_file = os.path.join(SCHEDULE_DIR, f"{agency_id}_{direction}.csv")
+    
+    # Open directly rather than stat'ing first; a missing file is one failed open
+    try:
+        f = open(csv_file, 'r', newline='', encoding='utf-8')
+    except FileNotFoundError:
+        print(f"Schedule CSV not found for {agency_id} direction {direction}: {csv_file}")
+        return None
+    
+    # Read CSV data
+    with f:
+        reader = csv.reader(f)
+        # Read first two header rows - FIRST row is stop IDs, SECOND row is A/D indicators
+        stop_ids = next(reader)     # First row: stop IDs
+        event_types = next(reader)   # Second row: A/D indicators
         
-        # Process train routes differently using schedule CSV
-        if route.get('mode') == 'train':
-            # Build CSV path: route-data/schedule/{agencyId}_{direction}.csv
-            csv_file = os.path.join(SCHEDULE_DIR, f"{agency_id}_{direction}.csv")
-            
-            if not os.path.exists(csv_file):
-                print(f"Schedule CSV not found for {agency_id} direction {direction}: {csv_file}")
+        # Validate header rows
+        if len(event_types) < 2 or len(stop_ids) < 2:
+            print(f"Invalid header rows in {csv_file}")
+            return None
+        
+        # Group trip rows by the route they belong to
+        rows_by_route = {}
+        for row in reader:
+            if not row or row[0].strip() == '':
                 continue
-            
-            # Read CSV data
-            with open(csv_file, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                # Read first two header rows - FIRST row is stop IDs, SECOND row is A/D indicators
-                stop_ids = next(reader)     # First row: stop IDs
-                event_types = next(reader)   # Second row: A/D indicators
-                
-                # Validate header rows
-                if len(event_types) < 2 or len(stop_ids) < 2:
-                    print(f"Invalid header rows in {csv_file}")
-                    continue
-                
-                # Process each trip row
-                for row in reader:
-                    if not row or row[0].strip() == '':
-                        continue
-                    
-                    # Check if this row belongs to the current route
-                    if row[0] != str(route_id):
-                        continue
-                    
-                    trip_num = row[1]
-                    trip_id = f"t-{agency_id}{group_id}{trip_num}"
-                    
-                    # Block ID for looped routes
-                    block_id = ""
-                    if route.get('loop', 'no') == 'yes':
-                        block_id = f"{agency_id}{group_id}{trip_num}"
-                    
-                    # Add trip
-                    trips.append({
-                        'route_id': group_id,
-                        'trip_id': trip_id,
-                        'service_id': 'everyday',
-                        'trip_headsign': route['name'],
-                        'direction_id': direction,
-                        'shape_id': route.get('shape_id', ''),
-                        'block_id': block_id
-                    })
-                    
-                    # Process stop times for this trip
-                    stop_seq = 1
-                    # Process columns in pairs (each stop has two columns: arrival and departure)
-                    for col_idx in range(2, len(row), 2):
-                        # Ensure we have a pair of columns
-                        if col_idx + 1 >= len(row):
-                            break
-                        
-                        # Get stop ID from header (both columns should have same stop ID)
-                        stop_id = stop_ids[col_idx] if col_idx < len(stop_ids) else None
-                        if not stop_id:
-                            continue
-                            
-                        # Get times for arrival and departure
-                        arrival_str = row[col_idx].strip()
-                        departure_str = row[col_idx + 1].strip()
-                        
-                        # Skip if both times are empty
-                        if not arrival_str and not departure_str:
-                            continue
-                            
-                        # If one time is missing, use the available one for both
-                        if not arrival_str:
-                            arrival_str = departure_str
-                        if not departure_str:
-                            departure_str = arrival_str
-                        
-                        # Convert time strings to seconds since midnight
-                        def parse_time(time_str):
-                            """Parse HH:MM string to seconds, handling 24+ times"""
-                            if ':' not in time_str:
-                                return 0
-                            h, m = time_str.split(':')
-                            h = int(h)
-                            m = int(m)
-                            # Handle times beyond 24:00
-                            if h < 24:
-                                return h * 3600 + m * 60
-                            # For times >= 24:00, convert to seconds directly
-                            return (h * 3600) + (m * 60)
-                        
-                        arrival_sec = parse_time(arrival_str)
-                        departure_sec = parse_time(departure_str)
-                        
-                        # Convert to GTFS time format (HH:MM:SS with possible 24+ hours)
-                        arrival_time = seconds_to_time_str(arrival_sec)
-                        departure_time = seconds_to_time_str(departure_sec)
-                        
-                        stop_times.append({
-                            'trip_id': trip_id,
-                            'stop_id': stop_id,
-                            'stop_sequence': stop_seq,
-                            'arrival_time': arrival_time,
-                            'departure_time': departure_time,
-                            'pickup_type': 0,
-                            'drop_off_type': 0
-                        })
-                        stop_seq += 1
+            rows_by_route.setdefault(row[0], []).append(row)
+    
+    return stop_ids, rows_by_route
+
+def add_train_trips(route, trips, stop_times, schedules):
+    """Append a train route's trips and stop times from its schedule CSV"""
+    route_id = route['relationId']
+    agency_id = route['agency_id']
+    group_id = route['group_id']
+    direction = route['directionId']
+    
+    key = (agency_id, direction)
+    if key not in schedules:
+        schedules[key] = load_schedule(agency_id, direction)
+    if schedules[key] is None:
+        return
+    stop_ids, rows_by_route = schedules[key]
+    
+    # Process each trip row of this route
+    for row in rows_by_route.get(str(route_id), ()):
+        trip_num = row[1]
+        trip_id = f"t-{agency_id}{group_id}{trip_num}"
         
-       # Process bus routes normally
-        else:
-            stop_file = os.path.join(ROUTE_DATA_DIR, str(route_id), 'stops.geojson')
+        # Block ID for looped routes
+        block_id = ""
+        if route.get('loop', 'no') == 'yes':
+            block_id = f"{agency_id}{group_id}{trip_num}"
+        
+        # Add trip
+        trips.append(Trip(group_id, trip_id, 'everyday', route['name'], direction,
+                          route.get('shape_id', ''), block_id))
+        
+        # Process stop times for this trip
+        stop_seq = 1
+        # Process columns in pairs (each stop has two columns: arrival and departure)
+        for col_idx in range(2, len(row), 2):
+            # Ensure we have a pair of columns
+            if col_idx + 1 >= len(row):
+                break
             
-            if not os.path.exists(stop_file):
-                print(f"Stop file not found for trip generation: {stop_file}")
+            # Get stop ID from header (both columns should have same stop ID)
+            stop_id = stop_ids[col_idx] if col_idx < len(stop_ids) else None
+            if not stop_id:
                 continue
                 
-            with open(stop_file) as f:
-                stop_data = json.load(f)
-            
-            # Extract stop sequence with coordinates and real/virtual status
-            stops = []
-            for feature in stop_data['features']:
-                props = feature['properties']
-                coords = feature['geometry']['coordinates']
-                stops.append({
-                    'stop_id': props['id'],
-                    'lon': coords[0],
-                    'lat': coords[1],
-                    'is_real': props.get('isReal', False)  # Track real vs virtual
-                })
+            # Get times for arrival and departure
+            arrival_str = row[col_idx].strip()
+            departure_str = row[col_idx + 1].strip()
             
-            # NEW: Prioritize real stops when projecting to shape
-            shape_id = route.get('shape_id')
-            if shape_id and shape_id in shapes_dict:
-                shape_points = shapes_dict[shape_id]
-                
-                # First project all stops
-                for stop in stops:
-                    min_dist = float('inf')
-                    closest_dist = 0
-                    # Find closest point on shape
-                    for pt in shape_points:
-                        d = haversine(stop['lon'], stop['lat'], pt['lon'], pt['lat'])
-                        if d < min_dist:
-                            min_dist = d
-                            closest_dist = pt['dist']
-                    stop['shape_dist'] = closest_dist
-                    stop['min_dist'] = min_dist
+            # Skip if both times are empty
+            if not arrival_str and not departure_str:
+                continue
                 
-                # Sort stops primarily by shape distance, secondarily by real status
-                stops.sort(key=lambda s: (
-                    s['shape_dist'],
-                    0 if s['is_real'] else 1  # Real stops come first at same position
-                ))
+            # If one time is missing, use the available one for both
+            if not arrival_str:
+                arrival_str = departure_str
+            if not departure_str:
+                departure_str = arrival_str
             
-            # Precompute segment times between stops
-            segment_times = [0]  # Start with 0 for first stop
-            for i in range(1, len(stops)):
-                dist = haversine(
-                    stops[i-1]['lon'], stops[i-1]['lat'],
-                    stops[i]['lon'], stops[i]['lat']
-                )
-                dist = max(dist, 0.01)  # At least 10 meters
-                speed = 30 if dist <= 5 else 55
-                segment_times.append((dist / speed) * 3600)  # in seconds
+            # Convert time strings to seconds since midnight
+            def parse_time(time_str):
+                """Parse HH:MM string to seconds, handling 24+ times"""
+                if ':' not in time_str:
+                    return 0
+                h, m = time_str.split(':')
+                h = int(h)
+                m = int(m)
+                # Handle times beyond 24:00
+                if h < 24:
+                    return h * 3600 + m * 60
+                # For times >= 24:00, convert to seconds directly
+                return (h * 3600) + (m * 60)
             
-            # Calculate cumulative travel times
-            cumulative_travel = [0]
-            for i in range(1, len(stops)):
-                cumulative_travel.append(cumulative_travel[-1] + segment_times[i])
+            arrival_sec = parse_time(arrival_str)
+            departure_sec = parse_time(departure_str)
             
-            # Get number of trips
-            try:
-                num_trips = int(route.get('trips', '0'))
-            except ValueError:
-                num_trips = 0
+            # Convert to GTFS time format (HH:MM:SS with possible 24+ hours)
+            arrival_time = seconds_to_time_str(arrival_sec)
+            departure_time = seconds_to_time_str(departure_sec)
             
-            if num_trips < 1:
-                continue
-                
-            # Parse operational times
-            start_sec = time_str_to_seconds(route['first_departure'])
-            end_sec = time_str_to_seconds(route['last_departure'])
-            headway_sec = (end_sec - start_sec) / (num_trips - 1) if num_trips > 1 else 0
+            stop_times.append(StopTime(trip_id, stop_id, stop_seq, arrival_time, departure_time, 0, 0))
+            stop_seq += 1
 
-            # Get current trip count for this direction
-            current_count = group_direction_counts[group_id][direction]
-            
-            # Generate trips
-            for idx in range(num_trips):
-                # Calculate the trip number within this direction
-                trip_num = current_count + idx + 1
-                trip_start = start_sec + idx * headway_sec
-                
-                # Format trip ID: t-{agency_id}{group_id}{direction}{trip_num}
-                trip_id = f"t-{agency_id}{group_id}{direction}{trip_num}"
-                
-                # Create block ID: {agency_id}{group_id}{trip_num} (without direction)
-                block_id = ""
-                if route['loop'] == 'yes':
-                    block_id = f"{agency_id}{group_id}{trip_num}"
-                
-                trips.append({
-                    'route_id': group_id,
-                    'trip_id': trip_id,
-                    'service_id': 'everyday',
-                    'trip_headsign': route['name'],
-                    'direction_id': direction,
-                    'shape_id': route.get('shape_id', ''),
-                    'block_id': block_id
-                })
-                
-                # Calculate stop times
-                for seq in range(len(stops)):
-                    arrival_sec = trip_start + cumulative_travel[seq] + (seq * 10)
-                    departure_sec = arrival_sec + 10
-                    
-                    stop_times.append({
-                        'trip_id': trip_id,
-                        'stop_id': stops[seq]['stop_id'],
-                        'stop_sequence': seq + 1,
-                        'arrival_time': seconds_to_time_str(arrival_sec),
-                        'departure_time': seconds_to_time_str(departure_sec),
-                        'pickup_type': 0,
-                        'drop_off_type': 0
-                    })
+def add_bus_trips(route, stop_sequence, trip_offset, trips, stop_time_blocks):
+    """Append a bus route's evenly spaced trips and their stop times"""
+    agency_id = route['agency_id']
+    group_id = route['group_id']
+    direction = route['directionId']
+    stop_ids, stop_lonlat_rad = stop_sequence
+    
+    # Get number of trips
+    try:
+        num_trips = int(route.get('trips', '0'))
+    except ValueError:
+        num_trips = 0
+    
+    if num_trips < 1:
+        return 0
+        
+    # Parse operational times
+    start_sec = time_str_to_seconds(route['first_departure'])
+    end_sec = time_str_to_seconds(route['last_departure'])
+    headway_sec = (end_sec - start_sec) / (num_trips - 1) if num_trips > 1 else 0
+
+    # Calculate every trip's stop times at once: one row per trip,
+    # one column per stop, with 10 seconds of dwell at each stop
+    num_stops = len(stop_ids)
+    trip_starts = start_sec + np.arange(num_trips) * float(headway_sec)
+    arrivals, departures = _gen_stop_times(
+        trip_starts, stop_lonlat_rad[:, 0], stop_lonlat_rad[:, 1], 10)
+    arrival_times = seconds_to_time_strs(arrivals)
+    departure_times = seconds_to_time_strs(departures)
+    
+    # Trip ID: t-{agency_id}{group_id}{direction}{trip_num}
+    # Block ID: {agency_id}{group_id}{trip_num} (without direction), looped routes only
+    trip_prefix = f"t-{agency_id}{group_id}{direction}"
+    block_prefix = f"{agency_id}{group_id}" if route['loop'] == 'yes' else None
+    headsign = route['name']
+    shape_id = route.get('shape_id', '')
+    
+    # Build every trip's IDs in one batch, numbering within this direction
+    trip_nums = [str(i) for i in range(trip_offset + 1, trip_offset + num_trips + 1)]
+    trip_ids = [trip_prefix + trip_num for trip_num in trip_nums]
+    block_ids = [block_prefix + trip_num for trip_num in trip_nums] if block_prefix else [""] * num_trips
+    
+    trips.extend(
+        Trip(group_id, trip_id, 'everyday', headsign, direction, shape_id, block_id)
+        for trip_id, block_id in zip(trip_ids, block_ids))
+    
+    # Emit the flattened (trips x stops) matrices in one go: trip IDs repeat
+    # across each row while stop IDs and sequence numbers cycle per trip
+    stop_time_blocks.append(zip(
+        itertools.chain.from_iterable(itertools.repeat(trip_id, num_stops) for trip_id in trip_ids),
+        stop_ids * num_trips,
+        itertools.chain.from_iterable(itertools.repeat(range(1, num_stops + 1), num_trips)),
+        arrival_times,
+        departure_times,
+        itertools.repeat(0),
+        itertools.repeat(0)))
+    
+    return num_trips
+
+def build_gtfs_rows(routes):
+    """Build stops, shapes, trips and stop times for all routes"""
+    # Deduplicated stops are kept as parallel stops.txt columns, with
+    # stop_index mapping each stop ID to its position in them
+    stop_index = {}
+    stop_names, stop_lats, stop_lons, stop_wheelchair = [], [], [], []
+    shapes = []
+    trips = []
+    # Stop times are kept as per-route blocks and chained lazily for writing
+    stop_time_blocks = []
+    num_stop_times = 0
+    # Fallback IDs are only drawn for stops without an OSM ID
+    fallback_ids = map("stop_{}".format, itertools.count(1))
+    # Trips added so far per (group, direction), bumped once per route (bus only)
+    trip_counts = {}
+    # Train schedule CSVs loaded so far, keyed by (agency_id, direction)
+    schedules = {}
+    
+    for route, result in zip(routes, process_route_data(routes)):
+        # Collect stops with deduplication, resolving each stop's ID once
+        # so stops.txt and the bus stop times agree on it
+        route_stop_ids = []
+        for stop_id, lon, lat, _, props in result['stops'] or ():
+            # Create unique stop ID using OSM ID or generate new
+            if stop_id is None:
+                stop_id = next(fallback_ids)
+            route_stop_ids.append(stop_id)
             
-            # Update the trip count for this direction
-            group_direction_counts[group_id][direction] += num_trips
+            # Only the first occurrence of a stop fills its columns
+            if stop_id not in stop_index:
+                stop_index[stop_id] = len(stop_names)
+                stop_names.append(props.get('name', f"Stop {stop_id}"))
+                stop_lats.append(lat)
+                stop_lons.append(lon)
+                stop_wheelchair.append(1 if props.get('wheelchair') == 'yes' else 0)
+        
+        # Collect the shape and store its ID for trip assignment
+        if result['shape'] is not None:
+            shapes.append(result['shape'])
+            route['shape_id'] = result['shape'][0]
+        
+        # Process train routes differently using schedule CSV
+        if route.get('mode') == 'train':
+            train_stop_times = []
+            add_train_trips(route, trips, train_stop_times, schedules)
+            stop_time_blocks.append(train_stop_times)
+            num_stop_times += len(train_stop_times)
+        # Process bus routes normally
+        elif result['stop_sequence'] is not None:
+            stop_order, stop_lonlat_rad = result['stop_sequence']
+            stop_ids = [route_stop_ids[i] for i in stop_order]
+            key = (route['group_id'], route['directionId'])
+            base = trip_counts.get(key, 0)
+            num_trips = add_bus_trips(
+                route, (stop_ids, stop_lonlat_rad), base, trips, stop_time_blocks)
+            trip_counts[key] = base + num_trips
+            num_stop_times += num_trips * len(stop_ids)
     
-    return trips, stop_times
+    # location_type is always 0
+    stops = list(map(Stop._make, zip(stop_index, stop_names, stop_lats, stop_lons,
+                                     itertools.repeat(0), stop_wheelchair)))
+    stop_times = itertools.chain.from_iterable(stop_time_blocks)
+    return stops, shapes, trips, stop_times, num_stop_times
 
 def create_calendar():
     """Calendar for everyday service with unlimited end date"""
@@ -462,18 +543,43 @@ def create_calendar():
         'end_date': '20991231'     # End on Dec 31, 2099 (far future)
     }]
 
-def write_gtfs(data, filename, fieldnames):
+def write_gtfs(data, filename, fieldnames, quote_safe=False):
     """Write GTFS CSV file"""
-    os.makedirs(GTFS_DIR, exist_ok=True)
     output_path = os.path.join(GTFS_DIR, filename)
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        if not isinstance(data, list):
-            data = list(data)
-        writer.writerows(data)
+    with open(output_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+        # Only for shapes.txt, whose fields never need quoting
+        if quote_safe:
+            row_template = ','.join(['%s'] * len(fieldnames)) + '\r\n'
+            f.write(','.join(fieldnames) + '\r\n')
+            f.writelines(row_template % row for row in data)
+        else:
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            # Peek at the first row to tell dict rows from tuples
+            rows = iter(data)
+            first = next(rows, None)
+            if first is not None:
+                rows = itertools.chain((first,), rows)
+                if isinstance(first, dict):
+                    rows = map(itemgetter(*fieldnames), rows)
+                writer.writerows(rows)
     print(f"Created: {output_path}")
 
+def iter_shape_rows(shapes):
+    """Yield shapes.txt rows from the columnar per-route shape arrays"""
+    for shape_id, lons, lats, dists in shapes:
+        yield from zip(itertools.repeat(shape_id), lons.tolist(), lats.tolist(),
+                       itertools.count(1), dists.tolist())
+
+def write_gtfs_zip():
+    """Package every GTFS file in GTFS_DIR into GTFS_ZIP"""
+    os.makedirs(os.path.dirname(GTFS_ZIP), exist_ok=True)
+    with zipfile.ZipFile(GTFS_ZIP, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename in sorted(os.listdir(GTFS_DIR)):
+            if filename.endswith('.txt'):
+                zf.write(os.path.join(GTFS_DIR, filename), arcname=filename)
+    print(f"Created: {GTFS_ZIP}")
+
 def main():
     print("Starting GTFS generation...")
     print(f"Repository root: {REPO_ROOT}")
@@ -481,44 +587,42 @@ def main():
     
     # Process data
     agencies, route_groups, routes = process_routes()
-    stops = process_stops(routes)
-    shapes = process_shapes(routes)
-    trips, stop_times = generate_trips(routes, shapes)  # Pass shapes to generate_trips
+    attach_route_paths(routes)
+    stops, shapes, trips, stop_times, num_stop_times = build_gtfs_rows(routes)
     
-    # Generate GTFS files
-    write_gtfs(agencies, 'agency.txt', 
-               ['agency_id', 'agency_name', 'agency_url', 'agency_timezone', 'agency_lang'])
-    
-    write_gtfs([
-        {
-            'route_id': group['group_id'],
-            'agency_id': group['agency_id'],
-            'route_short_name': group['group_id'],  # Koridor number
-            'route_long_name': group['name'],
-            'route_type': group['route_type'],
-            'route_color': group['color'].lstrip('#')
-        } for group in route_groups
-    ], 'routes.txt', 
-    ['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_type', 'route_color'])
-    
-    write_gtfs(trips, 'trips.txt', 
-               ['route_id', 'trip_id', 'service_id', 'trip_headsign', 'direction_id', 'shape_id', 'block_id'])
-    
-    write_gtfs(list(stops.values()), 'stops.txt', 
-               ['stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'location_type', 'wheelchair_boarding'])
-    
-    write_gtfs(stop_times, 'stop_times.txt', 
-               ['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time', 'pickup_type', 'drop_off_type'])
-    
-    write_gtfs(shapes, 'shapes.txt', 
-               ['shape_id', 'shape_pt_lon', 'shape_pt_lat', 'shape_pt_sequence', 'shape_dist_traveled'])
+    # Generate GTFS files concurrently
+    os.makedirs(GTFS_DIR, exist_ok=True)
+    writes = [
+        (write_gtfs, agencies, 'agency.txt',
+         ['agency_id', 'agency_name', 'agency_url', 'agency_timezone', 'agency_lang']),
+        (write_gtfs, [
+            (group['group_id'],  # route_id
+             group['agency_id'],
+             group['group_id'],  # route_short_name: Koridor number
+             group['name'],
+             group['route_type'],
+             group['color'].lstrip('#'))
+            for group in route_groups
+        ], 'routes.txt',
+         ['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_type', 'route_color']),
+        (write_gtfs, trips, 'trips.txt', Trip._fields),
+        (write_gtfs, stops, 'stops.txt', Stop._fields),
+        (write_gtfs, stop_times, 'stop_times.txt', StopTime._fields),
+        (write_gtfs, iter_shape_rows(shapes), 'shapes.txt',
+         ['shape_id', 'shape_pt_lon', 'shape_pt_lat', 'shape_pt_sequence', 'shape_dist_traveled'], True),
+        (write_gtfs, create_calendar(), 'calendar.txt',
+         ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'start_date', 'end_date']),
+    ]
+    with ThreadPoolExecutor(max_workers=len(writes)) as executor:
+        futures = [executor.submit(*write) for write in writes]
+    for future in futures:
+        future.result()  # Re-raise any error from a writer thread
     
-    write_gtfs(create_calendar(), 'calendar.txt', 
-               ['service_id', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday', 'start_date', 'end_date'])
+    write_gtfs_zip()
     
     print(f"GTFS generated successfully in {GTFS_DIR}/ directory")
     print(f"Processed {len(route_groups)} route groups and {len(routes)} directions")
-    print(f"Generated {len(trips)} trips and {len(stop_times)} stop times")
+    print(f"Generated {len(trips)} trips and {num_stop_times} stop times")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
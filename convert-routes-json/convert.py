@@ -2,6 +2,12 @@ import json
 import re
 from collections import defaultdict
 
+try:
+    import orjson
+except ImportError:
+    # orjson is optional: without it the json module reads and writes the files
+    orjson = None
+
 # === Agency metadata defaults ===
 AGENCY_METADATA = {
     "Metro Jabar Trans": {
@@ -72,8 +78,12 @@ AGENCY_METADATA = {
 
 # === Helper functions ===
 
+# Patterns are compiled once since the helpers run for every route
+_RE_PREFIX = re.compile(r"^(Commuter Line|Koridor \d+:?)\s*")
+_RE_VIA = re.compile(r"\s+via\s+(.*)")
+
 def simplify_name(name):
-    name = re.sub(r"^(Commuter Line|Koridor \d+:?)\s*", "", name)
+    name = _RE_PREFIX.sub("", name)
     return name.strip()
 
 def detect_direction(name):
@@ -89,11 +99,11 @@ def extract_code(name):
     return None
 
 def strip_via(name):
-    return re.sub(r"\s+via\s+.*", "", name)
+    return _RE_VIA.sub("", name)
 
 def get_origin_dest_via(name):
     """Extract origin, destination, and via (if any)"""
-    via_match = re.search(r"\s+via\s+(.*)", name)
+    via_match = _RE_VIA.search(name)
     via = via_match.group(1).strip() if via_match else None
 
     name_wo_via = strip_via(name)
@@ -109,8 +119,22 @@ def group_routes(routes):
     custom_groups = []
     used = set()
 
+    # Parse every name once, then index routes by (origin, dest, via) so
+    # each route's return leg is a lookup instead of a scan. Names without
+    # an arrow have no origin/destination, so they skip the regex and
+    # can never be matched
+    parsed = [get_origin_dest_via(route["name"]) if "→" in route["name"] else (None, None, None)
+              for route in routes]
+    by_od = defaultdict(list)
+    for j, origin_dest_via in enumerate(parsed):
+        if origin_dest_via[0] and origin_dest_via[1]:
+            by_od[origin_dest_via].append(j)
+
     for i, route in enumerate(routes):
         name = route["name"]
+        # Without a code or an arrow the route can join neither kind of group
+        if ":" not in name and "→" not in name:
+            continue
         code = extract_code(name)
 
         if code:
@@ -119,22 +143,20 @@ def group_routes(routes):
         else:
             if i in used:
                 continue
-            origin_i, dest_i, via_i = get_origin_dest_via(name)
+            origin_i, dest_i, via_i = parsed[i]
             if not origin_i or not dest_i:
                 continue
 
-            for j, other in enumerate(routes):
+            # Candidates run the opposite way with the same 'via' (or both
+            # None); the first unused one in route order is the match
+            for j in by_od.get((dest_i, origin_i, via_i), ()):
                 if i == j or j in used:
                     continue
-                origin_j, dest_j, via_j = get_origin_dest_via(other["name"])
-
-                if origin_j == dest_i and dest_j == origin_i:
-                    # Match only if both have same 'via' or both None
-                    if via_i == via_j:
-                        custom_groups.append(([route, other], route["color"], name.strip()))
-                        used.add(i)
-                        used.add(j)
-                        break
+                other = routes[j]
+                custom_groups.append(([route, other], route["color"], name.strip()))
+                used.add(i)
+                used.add(j)
+                break
 
     return code_groups, custom_groups
 
@@ -219,12 +241,17 @@ def convert_old_to_new(old_data):
 # === Execute the script ===
 
 if __name__ == "__main__":
-    with open("convert-routes-json/routes.json", "r", encoding="utf-8") as f:
-        old_routes = json.load(f)
+    with open("convert-routes-json/routes.json", "rb") as f:
+        old_routes = orjson.loads(f.read()) if orjson else json.load(f)
 
     new_routes = convert_old_to_new(old_routes)
 
-    with open("convert-routes-json/routes-new.json", "w", encoding="utf-8") as f:
-        json.dump(new_routes, f, indent=2, ensure_ascii=False)
+    # Both writers produce the same 2-space indented UTF-8 output
+    if orjson:
+        with open("convert-routes-json/routes-new.json", "wb") as f:
+            f.write(orjson.dumps(new_routes, option=orjson.OPT_INDENT_2))
+    else:
+        with open("convert-routes-json/routes-new.json", "w", encoding="utf-8") as f:
+            json.dump(new_routes, f, indent=2, ensure_ascii=False)
 
     print("✅ Converted routes.json saved as routes-new.json")